@@ -1,47 +1,65 @@
 from __future__ import annotations
-import asyncio, os, hmac, hashlib, csv
+import time
+START_TS = time.time()  # до импорта aiogram: отсюда считается время до первого апдейта
+
+import asyncio, os, hmac, hashlib, csv, html, json, socket, sqlite3
 from datetime import datetime, timedelta
 from typing import Optional
 
-from aiogram import Bot, Dispatcher, F
+from aiogram import Bot, Dispatcher, Router, F
+from aiogram.client.bot import DefaultBotProperties
+from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.storage.memory import MemoryStorage
-from dotenv import load_dotenv
 
-from db import get_conn, init_db
+from db import get_conn, init_db, SessionStore, catalog_id, now_ts, to_ts, from_ts, ts_iso
+from dispatch import UserSerialMiddleware
+from membership import MembershipCache
+from search import search_feedback, HL_START, HL_END
 from keyboards import rating_kb, start_kb, manager_kb, prize_kb
 from prizes import DEFAULT_PRIZES, weighted_choice, gen_code
-import os, socket, time
-from aiogram import Router, F
-from aiogram.types import Message
-router = Router()
 
-START_TS = time.time()
-load_dotenv()
+# На сервере переменные заданы окружением, и .env нет — dotenv не загружаем вовсе
+if any(os.path.exists(p) for p in (".env", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))):
+    from dotenv import load_dotenv
+    load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 SECRET_KEY = os.getenv("SECRET_KEY", "change_this_secret").encode()
 MANAGERS_CHAT_ID = int(os.getenv("MANAGERS_CHAT_ID", "0"))
+ADMINS = [int(x) for x in os.getenv("ADMINS", "").split(",") if x.strip().isdigit()]
 PROMO_VALID_DAYS = int(os.getenv("PROMO_VALID_DAYS", "30"))
 DB_PATH = os.getenv("DB_PATH", "./bot.db")
-
-from aiogram.client.bot import DefaultBotProperties
-from aiogram.enums import ParseMode
+BACKUP_DIR = os.getenv("BACKUP_DIR", "./backups")
+BACKUP_INTERVAL_MIN = int(os.getenv("BACKUP_INTERVAL_MIN", "0"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+MEMBERSHIP_BLOOM_BYTES = int(os.getenv("MEMBERSHIP_BLOOM_BYTES", str(1 << 20)))
+MEMBERSHIP_GUESTS_MAX = int(os.getenv("MEMBERSHIP_GUESTS_MAX", "100000"))
 
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 
 dp = Dispatcher(storage=MemoryStorage())
+if RECORD_DIR:
+    from recorder import UpdateRecorder, recorder_middleware
+    dp.update.outer_middleware(recorder_middleware(UpdateRecorder(RECORD_DIR)))
+# Апдейты одного гостя — строго по очереди, разных гостей — параллельно
+dp.update.outer_middleware(UserSerialMiddleware())
 
 conn = get_conn(DB_PATH)
 init_db(conn)
 
-# Простая in-memory «память» на процесс для хранения текущего визита пользователя
-VISIT_CACHE: dict[str, str] = {}
+# Текущий визит пользователя: хранится в базе, чтобы переживать перезапуск
+# и быть общим для всех воркеров (см. cluster.py)
+VISIT_CACHE = SessionStore(conn)
 
-NEGATIVE_TRIGGERS = ["холод", "солен", "солё", "долго", "волос", "гряз", "невкус", "остыл", "плохо", "хам", "опозд"]
+# Известные гости и использованные визиты: /start без лишних запросов к базе.
+# Прогревается в фоне после старта (main); до этого просто ходит в базу.
+MEMBERSHIP = MembershipCache(MEMBERSHIP_BLOOM_BYTES, MEMBERSHIP_GUESTS_MAX)
+
+VISIT_USED_TEXT = "❗️ По этому визиту отзыв уже был оставлен. Спасибо за участие!"
 
-def now_iso() -> str:
-    return datetime.utcnow().isoformat()
+NEGATIVE_TRIGGERS = ["холод", "солен", "солё", "долго", "волос", "гряз", "невкус", "остыл", "плохо", "хам", "опозд"]
 
 def sign_visit(visit_id: str) -> str:
     return hmac.new(SECRET_KEY, visit_id.encode(), hashlib.sha256).hexdigest()
@@ -50,14 +68,23 @@ def verify_visit(visit_id: str, sign: str) -> bool:
     return hmac.compare_digest(sign_visit(visit_id), (sign or "").lower())
 
 async def ensure_guest(msg: Message):
+    if MEMBERSHIP.known_guest(msg.from_user.id):
+        return
     with conn:
         conn.execute(
             "INSERT OR IGNORE INTO guests(tg_user_id, username, created_at) VALUES(?,?,?)",
-            (msg.from_user.id, msg.from_user.username, now_iso())
+            (msg.from_user.id, msg.from_user.username, now_ts())
         )
+    MEMBERSHIP.add_guest(msg.from_user.id)
 
 async def visit_used(visit_id: str) -> bool:
-    row = conn.execute("SELECT 1 FROM feedback WHERE visit_id = ?", (visit_id,)).fetchone()
+    if not MEMBERSHIP.maybe_used_visit(visit_id):
+        return False
+    row = conn.execute(
+        "SELECT 1 FROM feedback WHERE visit_id=? AND visit_id <> '' AND duplicate = 0", (visit_id,)
+    ).fetchone()
+    if row is None:
+        MEMBERSHIP.false_positive()
     return row is not None
 
 async def create_feedback_placeholder(user_id: int, visit_id: str):
@@ -65,7 +92,7 @@ async def create_feedback_placeholder(user_id: int, visit_id: str):
         conn.execute(
             "INSERT INTO visits(visit_id, tg_user_id, created_at) VALUES(?,?,?) "
             "ON CONFLICT(visit_id) DO NOTHING",
-            (visit_id, user_id, now_iso())
+            (visit_id, user_id, now_ts())
         )
 
 @dp.message(Command("start"))
@@ -88,7 +115,7 @@ async def cmd_start(message: Message, command: CommandObject):
 
     if visit_id:
         if await visit_used(visit_id):
-            await message.answer("❗️ По этому визиту отзыв уже был оставлен. Спасибо за участие!")
+            await message.answer(VISIT_USED_TEXT)
             return
         await create_feedback_placeholder(message.from_user.id, visit_id)
         await message.answer(
@@ -136,8 +163,10 @@ async def _maybe_alert(feedback_id: int, username: Optional[str], table_hint: st
     await bot.send_message(MANAGERS_CHAT_ID, text, reply_markup=manager_kb(feedback_id))
 
 def _store_rating(user_id: int, step: str, value: int, visit_id: str):
+    # Без визита (нет сессии) уникального индекса нет — ищем строку гостя как раньше
+    by_visit = " AND visit_id <> '' AND duplicate = 0" if visit_id else ""
     row = conn.execute(
-        "SELECT id, service, taste, speed, clean FROM feedback WHERE tg_user_id=? AND visit_id=?",
+        "SELECT id, service, taste, speed, clean FROM feedback WHERE tg_user_id=? AND visit_id=?" + by_visit,
         (user_id, visit_id)
     ).fetchone()
     if row:
@@ -149,15 +178,25 @@ def _store_rating(user_id: int, step: str, value: int, visit_id: str):
         return fid, fields
     else:
         with conn:
-            conn.execute(
-                f"INSERT INTO feedback(tg_user_id, visit_id, created_at, {step}) VALUES(?,?,?,?)",
-                (user_id, visit_id, now_iso(), value)
+            cur = conn.execute(
+                f"INSERT OR IGNORE INTO feedback(tg_user_id, visit_id, created_at, {step}) VALUES(?,?,?,?)",
+                (user_id, visit_id, now_ts(), value)
             )
-            fid = conn.execute("SELECT last_insert_rowid() AS id").fetchone()["id"]
+        if cur.rowcount == 0:
+            # отзыв по этому визиту уже оставил другой гость
+            return None, None
+        fid = cur.lastrowid
+        MEMBERSHIP.add_used_visit(visit_id)
         fields = {"service": None, "taste": None, "speed": None, "clean": None}
         fields[step] = value
         return fid, fields
 
+async def _visit_taken(c: CallbackQuery):
+    # Визит занят другим гостем: сессию закрываем, иначе следующий текст
+    # этого гостя запустил бы розыгрыш приза по чужому визиту
+    VISIT_CACHE.pop(f"visit_id:{c.from_user.id}", None)
+    await c.message.edit_text(VISIT_USED_TEXT)
+
 def _low_rating(fields: dict) -> bool:
     vals = [v for v in [fields.get("service"), fields.get("taste"), fields.get("speed"), fields.get("clean")] if v is not None]
     return any(v <= 3 for v in vals)
@@ -166,21 +205,30 @@ def _low_rating(fields: dict) -> bool:
 async def cb_rate_service(c: CallbackQuery):
     v = int(c.data.split(":")[1])
     visit_id = VISIT_CACHE.get(f"visit_id:{c.from_user.id}", "")
-    _store_rating(c.from_user.id, "service", v, visit_id)
+    fid, _ = _store_rating(c.from_user.id, "service", v, visit_id)
+    if fid is None:
+        await _visit_taken(c)
+        return
     await c.message.edit_text("Оцените <b>вкус блюд</b>:", reply_markup=rating_kb("taste"))
 
 @dp.callback_query(F.data.startswith("taste:"))
 async def cb_rate_taste(c: CallbackQuery):
     v = int(c.data.split(":")[1])
     visit_id = VISIT_CACHE.get(f"visit_id:{c.from_user.id}", "")
-    _store_rating(c.from_user.id, "taste", v, visit_id)
+    fid, _ = _store_rating(c.from_user.id, "taste", v, visit_id)
+    if fid is None:
+        await _visit_taken(c)
+        return
     await c.message.edit_text("Оцените <b>скорость подачи</b>:", reply_markup=rating_kb("speed"))
 
 @dp.callback_query(F.data.startswith("speed:"))
 async def cb_rate_speed(c: CallbackQuery):
     v = int(c.data.split(":")[1])
     visit_id = VISIT_CACHE.get(f"visit_id:{c.from_user.id}", "")
-    _store_rating(c.from_user.id, "speed", v, visit_id)
+    fid, _ = _store_rating(c.from_user.id, "speed", v, visit_id)
+    if fid is None:
+        await _visit_taken(c)
+        return
     await c.message.edit_text("Оцените <b>чистоту и атмосферу</b>:", reply_markup=rating_kb("clean"))
 
 @dp.callback_query(F.data.startswith("clean:"))
@@ -188,6 +236,9 @@ async def cb_rate_clean(c: CallbackQuery):
     v = int(c.data.split(":")[1])
     visit_id = VISIT_CACHE.get(f"visit_id:{c.from_user.id}", "")
     fid, fields = _store_rating(c.from_user.id, "clean", v, visit_id)
+    if fid is None:
+        await _visit_taken(c)
+        return
 
     if _low_rating(fields):
         await c.message.edit_text(
@@ -217,7 +268,7 @@ async def cb_call_manager(c: CallbackQuery):
 async def cb_continue(c: CallbackQuery):
     await c.message.edit_text("Оставите короткий комментарий? Напишите сообщением или отправьте «-» чтобы пропустить.")
 
-@dp.message(F.text)
+@dp.message(F.text & ~F.text.startswith("/"))
 async def catch_comment(message: Message):
     visit_id = VISIT_CACHE.get(f"visit_id:{message.from_user.id}")
     if not visit_id:
@@ -228,7 +279,7 @@ async def catch_comment(message: Message):
         text = ""
 
     row = conn.execute(
-        "SELECT id, comment FROM feedback WHERE tg_user_id=? AND visit_id=?",
+        "SELECT id, comment FROM feedback WHERE tg_user_id=? AND visit_id=? AND visit_id <> '' AND duplicate = 0",
         (message.from_user.id, visit_id)
     ).fetchone()
     if row:
@@ -247,27 +298,53 @@ async def catch_comment(message: Message):
     await run_prize_flow(message, visit_id)
 
 async def run_prize_flow(message: Message, visit_id: str):
+    # Приз по визиту получает только тот, чей отзыв по нему записан
+    owner = conn.execute(
+        "SELECT tg_user_id FROM feedback WHERE visit_id=? AND visit_id <> '' AND duplicate = 0", (visit_id,)
+    ).fetchone()
+    if owner is None:
+        await message.answer("Сначала оцените визит — это займёт минуту 🙂", reply_markup=start_kb())
+        return
+    if owner["tg_user_id"] != message.from_user.id:
+        VISIT_CACHE.pop(f"visit_id:{message.from_user.id}", None)
+        await message.answer(VISIT_USED_TEXT)
+        return
+
     await message.answer("🎡 Запускаем колесо подарков…")
 
     prize = weighted_choice(DEFAULT_PRIZES)
     code = gen_code()
-    valid_until = (datetime.utcnow() + timedelta(days=PROMO_VALID_DAYS)).isoformat()
+    title = prize["title"]
+    valid_until = to_ts(datetime.utcnow() + timedelta(days=PROMO_VALID_DAYS))
+    prize_id = catalog_id(conn, title, prize["type"])
 
     with conn:
-        conn.execute(
-            """INSERT INTO prizes(code, title, type, valid_until, user_id, visit_id, status, created_at)
-               VALUES(?,?,?,?,?,?,?,?)""",
-            (code, prize["title"], prize["type"], valid_until, message.from_user.id, visit_id, "issued", now_iso())
+        cur = conn.execute(
+            """INSERT OR IGNORE INTO prizes(code, prize_id, valid_until, user_id, visit_id, status, created_at)
+               VALUES(?,?,?,?,?,?,?)""",
+            (code, prize_id, valid_until, message.from_user.id, visit_id, "issued", now_ts())
         )
+    if cur.rowcount == 0:
+        # Приз по визиту уже выдан (повтор): показываем тот же код, а не разыгрываем новый
+        row = conn.execute(
+            "SELECT p.code, c.title, p.valid_until FROM prizes p JOIN prize_catalog c ON c.id=p.prize_id "
+            "WHERE p.visit_id=? AND p.visit_id <> '' AND p.status <> 'duplicate' AND p.user_id=?",
+            (visit_id, message.from_user.id)
+        ).fetchone()
+        if not row:
+            await message.answer(VISIT_USED_TEXT)
+            VISIT_CACHE.pop(f"visit_id:{message.from_user.id}", None)
+            return
+        code, title, valid_until = row["code"], row["title"], row["valid_until"]
 
     await message.answer(
         "🎉 Вам выпал приз: <b>{title}</b>\n"
         "Ваш промокод: <code>{code}</code>\n"
         "Действует до <b>{date}</b>.\n"
         "Покажите код официанту перед закрытием счёта.".format(
-            title=prize["title"],
+            title=title,
             code=code,
-            date=(datetime.utcnow() + timedelta(days=PROMO_VALID_DAYS)).date().strftime("%d.%m.%Y")
+            date=from_ts(valid_until).strftime("%d.%m.%Y")
         ),
         reply_markup=prize_kb(code)
     )
@@ -277,12 +354,15 @@ async def run_prize_flow(message: Message, visit_id: str):
 @dp.callback_query(F.data.startswith("show:"))
 async def cb_show_code(c: CallbackQuery):
     code = c.data.split(":")[1]
-    row = conn.execute("SELECT title, valid_until, status FROM prizes WHERE code=?", (code,)).fetchone()
+    row = conn.execute(
+        "SELECT c.title, p.valid_until, p.status FROM prizes p JOIN prize_catalog c ON c.id=p.prize_id WHERE p.code=?",
+        (code,)
+    ).fetchone()
     if not row:
         await c.answer("Код не найден", show_alert=True)
         return
 
-    dt = row["valid_until"][:10] if row["valid_until"] else "-"
+    dt = from_ts(row["valid_until"]).date().isoformat() if row["valid_until"] is not None else "-"
     await c.answer()
     await c.message.answer(
         f"""🎟 Промокод <code>{code}</code>
@@ -308,24 +388,24 @@ async def cmd_redeem(message: Message, command: CommandObject):
         await message.answer("Использование: /redeem <CODE>")
         return
     code = command.args.strip().upper()
-    row = conn.execute("SELECT status, title, valid_until FROM prizes WHERE code=?", (code,)).fetchone()
+    row = conn.execute(
+        "SELECT p.status, c.title, p.valid_until FROM prizes p JOIN prize_catalog c ON c.id=p.prize_id WHERE p.code=?",
+        (code,)
+    ).fetchone()
     if not row:
         await message.answer("❌ Код не найден")
         return
     if row["status"] != "issued":
         await message.answer(f"Статус кода: {row['status']} — погасить нельзя")
         return
-    try:
-        if datetime.utcnow() > datetime.fromisoformat(row["valid_until"]):
-            await message.answer("⏳ Срок действия истёк")
-            return
-    except Exception:
-        pass
+    if row["valid_until"] is not None and now_ts() > row["valid_until"]:
+        await message.answer("⏳ Срок действия истёк")
+        return
 
     with conn:
         conn.execute(
             "UPDATE prizes SET status='redeemed', redeemed_at=?, redeemed_by=? WHERE code=?",
-            (now_iso(), message.from_user.id, code)
+            (now_ts(), message.from_user.id, code)
         )
     await message.answer(f"✅ Погашено. Приз: <b>{row['title']}</b>")
 
@@ -335,29 +415,33 @@ async def cmd_gifts(message: Message):
     lines += [f"- {p['title']}: {p['weight']}%" for p in DEFAULT_PRIZES]
     await message.answer("\n".join(lines))
 
+def _period_since(period: str) -> Optional[datetime]:
+    now = datetime.utcnow()
+    if period == "today":
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        return now - timedelta(days=7)
+    if period == "month":
+        return now - timedelta(days=30)
+    return None
+
 @dp.message(Command("stats"))
 async def cmd_stats(message: Message, command: CommandObject):
     period = (command.args or "today").strip()
-    now = datetime.utcnow()
-    if period == "today":
-        since = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == "week":
-        since = now - timedelta(days=7)
-    elif period == "month":
-        since = now - timedelta(days=30)
-    else:
+    since = _period_since(period)
+    if since is None:
         await message.answer("Использование: /stats [today|week|month]")
         return
 
     cnt = conn.execute(
         "SELECT COUNT(*) c FROM feedback WHERE created_at >= ?",
-        (since.isoformat(),)
+        (to_ts(since),)
     ).fetchone()["c"]
 
     if cnt:
         avg = conn.execute(
             "SELECT avg(service), avg(taste), avg(speed), avg(clean) FROM feedback WHERE created_at >= ?",
-            (since.isoformat(),)
+            (to_ts(since),)
         ).fetchone()
         await message.answer(
             f"📊 За период: {period}\n"
@@ -366,12 +450,76 @@ async def cmd_stats(message: Message, command: CommandObject):
         )
     else:
         await message.answer(f"📊 За период: {period}\nОтзывов пока нет.")
-import os, socket, time
-from aiogram import Router, F
-from aiogram.types import Message
-router = Router()
 
-START_TS = time.time()
+SEARCH_PAGE = 5
+
+def _is_staff(user_id: int, chat_id: int) -> bool:
+    # Комментарии, визиты и оценки гостей — только для админов и чата менеджеров
+    return user_id in ADMINS or (MANAGERS_CHAT_ID != 0 and chat_id == MANAGERS_CHAT_ID)
+
+def _search_page(query: str, period: str, offset: int):
+    since = _period_since(period)
+    total, rows = search_feedback(conn, query, to_ts(since) if since else 0, SEARCH_PAGE, offset)
+    if not total:
+        return f"🔎 «{html.escape(query)}»: ничего не найдено", None
+
+    lines = [f"🔎 «{html.escape(query)}» ({period}): найдено {total}, {offset + 1}–{offset + len(rows)}"]
+    for r in rows:
+        snippet = html.escape(r["snippet"] or "").replace(HL_START, "<b>").replace(HL_END, "</b>")
+        # у строк, перенесённых из v1 с нераспознанной датой, created_at = NULL
+        day = ts_iso(r["created_at"])[:10] if r["created_at"] is not None else "-"
+        lines.append(
+            f"\n#{r['id']} • визит {html.escape(r['visit_id'] or '-')} • {day}\n"
+            f"сервис {r['service'] or '-'} • вкус {r['taste'] or '-'} • скорость {r['speed'] or '-'} • чистота {r['clean'] or '-'}\n"
+            f"<i>{snippet}</i>"
+        )
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"srch:{max(offset - SEARCH_PAGE, 0)}"))
+    if offset + SEARCH_PAGE < total:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"srch:{offset + SEARCH_PAGE}"))
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
+
+@dp.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject):
+    if not _is_staff(message.from_user.id, message.chat.id):
+        return
+    words = (command.args or "").split()
+    period = "all"
+    if words and _period_since(words[-1]) is not None:
+        period = words.pop()
+    if not words:
+        await message.answer("Использование: /search <запрос> [today|week|month]")
+        return
+    query = " ".join(words)
+    try:
+        text, kb = _search_page(query, period, 0)
+    except sqlite3.OperationalError:
+        await message.answer("Поиск недоступен: SQLite собран без FTS5")
+        return
+    # запрос нужен для листания страниц — в callback_data он не помещается
+    VISIT_CACHE[f"search:{message.from_user.id}"] = json.dumps({"q": query, "period": period})
+    await message.answer(text, reply_markup=kb)
+
+@dp.callback_query(F.data.startswith("srch:"))
+async def cb_search_page(c: CallbackQuery):
+    if not _is_staff(c.from_user.id, c.message.chat.id if c.message else 0):
+        await c.answer()
+        return
+    state = VISIT_CACHE.get(f"search:{c.from_user.id}")
+    if not state:
+        await c.answer("Повторите поиск", show_alert=True)
+        return
+    state = json.loads(state)
+    try:
+        text, kb = _search_page(state["q"], state["period"], int(c.data.split(":")[1]))
+    except sqlite3.OperationalError:
+        await c.answer("Поиск недоступен: SQLite собран без FTS5", show_alert=True)
+        return
+    await c.answer()
+    await c.message.edit_text(text, reply_markup=kb)
+
+router = Router()
 
 @router.message(F.text == "/where")
 async def where_am_i(message: Message):
@@ -398,27 +546,53 @@ async def cmd_export(message: Message):
         rows = conn.execute(
             """
             SELECT f.created_at,f.tg_user_id,f.visit_id,f.service,f.taste,f.speed,f.clean,f.comment,
-                   p.code,p.title,p.status,p.valid_until
+                   p.code,c.title,p.status,p.valid_until
             FROM feedback f
             LEFT JOIN prizes p ON p.user_id=f.tg_user_id AND p.visit_id=f.visit_id
+            LEFT JOIN prize_catalog c ON c.id=p.prize_id
             ORDER BY f.created_at DESC
             """
         ).fetchall()
         for r in rows:
             w.writerow([
-                r["created_at"], r["tg_user_id"], r["visit_id"], r["service"], r["taste"], r["speed"], r["clean"],
+                ts_iso(r["created_at"]), r["tg_user_id"], r["visit_id"], r["service"], r["taste"], r["speed"], r["clean"],
                 (r["comment"] or "").replace("\n", " "),
                 r["code"] if "code" in r.keys() else "",
                 r["title"] if "title" in r.keys() else "",
                 r["status"] if "status" in r.keys() else "",
-                r["valid_until"] if "valid_until" in r.keys() else ""
+                ts_iso(r["valid_until"]) if "valid_until" in r.keys() else ""
             ])
     await message.answer_document(FSInputFile(path))
 
+async def _warm_membership():
+    await MEMBERSHIP.warm_async(conn)
+    m = MEMBERSHIP.stats()
+    print(f"Membership cache: {m['guests']} guests, {m['visits']} used visits, "
+          f"bloom {m['bloom_bytes'] // 1024} KB, expected FP {m['fp_expected']:.1e}")
+
+_first_update_logged = False
+
+@dp.update.outer_middleware()
+async def _log_first_update(handler, event, data):
+    global _first_update_logged
+    result = await handler(event, data)
+    if not _first_update_logged:
+        _first_update_logged = True
+        print(f"First update handled {time.time() - START_TS:.2f} s after start")
+    return result
+
 async def main():
     assert BOT_TOKEN and BOT_TOKEN != "8018287894:REPLACE_ME", "Заполните BOT_TOKEN в .env"
-    print("Bot started")
-    await dp.start_polling(bot)
+    background = [asyncio.create_task(_warm_membership())]
+    if BACKUP_INTERVAL_MIN > 0:
+        from backup import backup_loop
+        background.append(asyncio.create_task(backup_loop(conn, BACKUP_DIR, BACKUP_INTERVAL_MIN, BACKUP_KEEP)))
+    print(f"Bot started in {time.time() - START_TS:.2f} s")
+    try:
+        await dp.start_polling(bot)
+    finally:
+        for task in background:
+            task.cancel()
 
 if __name__ == "__main__":
     asyncio.run(main())
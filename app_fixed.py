@@ -6,7 +6,6 @@ from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.filters import Command, CommandStart
 from aiogram.client.default import DefaultBotProperties
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -25,7 +24,7 @@ if not BOT_TOKEN:
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
 dp = Dispatcher()
 tz = ZoneInfo(TIMEZONE)
-scheduler = AsyncIOScheduler(timezone=tz)
+_ticker = None  # задача периодической рассылки опросов
 
 DB = "data.db"
 
@@ -249,10 +248,19 @@ async def survey_scheduler():
                 except Exception as e:
                     logging.exception('Failed to send survey: %s', e)
 
+async def every(minutes: int, job):
+    # Вместо APScheduler: один периодический таймер на asyncio
+    while True:
+        await asyncio.sleep(minutes * 60)
+        try:
+            await job()
+        except Exception:
+            logging.exception('Periodic job %s failed', job.__name__)
+
 async def on_startup():
+    global _ticker
     setup_db()
-    scheduler.add_job(survey_scheduler, 'interval', minutes=5, id='survey-tick')
-    scheduler.start()
+    _ticker = asyncio.create_task(every(5, survey_scheduler))
     logging.info('Scheduler started. Bot is up.')
 
 async def main():
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Онлайн-бэкап bot.db через SQLite backup API.
+
+Бот копирует базу через своё соединение небольшими порциями страниц в
+отдельном потоке, поэтому event loop и запись в базу не останавливаются на
+время бэкапа. С отдельного соединения (CLI, фронт cluster.py) копия снимается
+за один шаг: в WAL это чтение одного согласованного снимка, писатели не ждут.
+
+    python backup.py snapshot              # разовый снимок
+    python backup.py list                  # список снимков + проверка sha256
+    python backup.py restore <snapshot>    # восстановление (бот должен быть остановлен)
+"""
+from __future__ import annotations
+import asyncio, hashlib, logging, os, sqlite3, sys, time
+from datetime import datetime
+from typing import List, Optional
+
+from db import get_conn
+
+log = logging.getLogger(__name__)
+
+PREFIX = "bot-"
+SUFFIX = ".db"
+# Страниц за один шаг и пауза между шагами (сек): между шагами соединение
+# свободно для обработчиков, а GIL отпущен и во время шага, и во время паузы.
+STEP_PAGES = 64
+STEP_SLEEP = 0.005
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _write_checksum(path: str, digest: str):
+    with open(path + ".sha256", "w", encoding="utf-8") as f:
+        f.write(f"{digest}  {os.path.basename(path)}\n")
+
+def verify_snapshot(path: str) -> bool:
+    try:
+        with open(path + ".sha256", encoding="utf-8") as f:
+            expected = f.read().split()[0]
+    except (OSError, IndexError):
+        return False
+    return _sha256(path) == expected
+
+def list_snapshots(backup_dir: str) -> List[str]:
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted(n for n in os.listdir(backup_dir) if n.startswith(PREFIX) and n.endswith(SUFFIX))
+    return [os.path.join(backup_dir, n) for n in names]
+
+def _copy(src, dst_path: str, pages: int, sleep: float):
+    dst = sqlite3.connect(dst_path)
+    # Временный файл: на диск он сбрасывается один раз, после копирования.
+    dst.execute("PRAGMA synchronous=OFF")
+    try:
+        progress = (lambda status, remaining, total: time.sleep(sleep)) if sleep else None
+        src.backup(dst, pages=pages, progress=progress)
+        ok = dst.execute("PRAGMA quick_check").fetchone()[0]
+        if ok != "ok":
+            raise sqlite3.DatabaseError(f"snapshot check failed: {ok}")
+    finally:
+        dst.close()
+    fd = os.open(dst_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def rotate(backup_dir: str, keep: int):
+    for path in list_snapshots(backup_dir)[:-keep] if keep > 0 else []:
+        for p in (path, path + ".sha256"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+async def snapshot(conn, backup_dir: str, keep: int = 7,
+                   pages: int = STEP_PAGES, sleep: float = STEP_SLEEP) -> str:
+    """Снимок базы `conn` в backup_dir: bot-YYYYmmdd-HHMMSS.db + .sha256.
+
+    Порциями (pages > 0) можно копировать только через соединение, которое
+    пишет в базу: его изменения попадают в копию без перезапуска бэкапа.
+    Запись через любое другое соединение перезапускает копирование с начала,
+    и под нагрузкой оно не заканчивается — для отдельного соединения нужен
+    pages=-1 (см. snapshot_separate).
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    name = PREFIX + datetime.utcnow().strftime("%Y%m%d-%H%M%S") + SUFFIX
+    path = os.path.join(backup_dir, name)
+    tmp = path + ".part"
+    try:
+        await asyncio.to_thread(_copy, conn, tmp, pages, sleep)
+        digest = await asyncio.to_thread(_sha256, tmp)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    _write_checksum(path, digest)
+    rotate(backup_dir, keep)
+    return path
+
+async def snapshot_separate(conn, backup_dir: str, keep: int = 7) -> str:
+    """Снимок через соединение, которым бот не пишет: один шаг, без пауз."""
+    return await snapshot(conn, backup_dir, keep, pages=-1, sleep=0)
+
+async def backup_loop(conn, backup_dir: str, interval_min: int, keep: int, separate: bool = False):
+    take = snapshot_separate if separate else snapshot
+    while True:
+        await asyncio.sleep(interval_min * 60)
+        try:
+            path = await take(conn, backup_dir, keep)
+            log.info("Backup saved: %s", path)
+        except Exception:
+            log.exception("Backup failed")
+
+def restore(snapshot_path: str, db_path: str) -> Optional[str]:
+    """Восстанавливает db_path из снимка. Текущая база сохраняется рядом
+    как <db_path>.pre-restore. Возвращает путь к этой копии."""
+    if not verify_snapshot(snapshot_path):
+        raise ValueError(f"checksum mismatch: {snapshot_path}")
+    saved = None
+    if os.path.exists(db_path):
+        saved = db_path + ".pre-restore"
+        cur = sqlite3.connect(db_path)
+        try:
+            _copy(cur, saved, -1, 0)
+        finally:
+            cur.close()
+    src = sqlite3.connect(snapshot_path)
+    dst = sqlite3.connect(db_path)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    return saved
+
+def main(argv: List[str]):
+    from dotenv import load_dotenv
+    load_dotenv()
+    db_path = os.getenv("DB_PATH", "./bot.db")
+    backup_dir = os.getenv("BACKUP_DIR", "./backups")
+    keep = int(os.getenv("BACKUP_KEEP", "7"))
+
+    cmd = argv[1] if len(argv) > 1 else ""
+    if cmd == "snapshot":
+        conn = get_conn(db_path)
+        try:
+            print(asyncio.run(snapshot_separate(conn, backup_dir, keep)))
+        finally:
+            conn.close()
+    elif cmd == "list":
+        for path in list_snapshots(backup_dir):
+            state = "ok" if verify_snapshot(path) else "BAD CHECKSUM"
+            print(f"{path}\t{os.path.getsize(path)}\t{state}")
+    elif cmd == "restore" and len(argv) > 2:
+        saved = restore(argv[2], db_path)
+        print(f"Restored {db_path} from {argv[2]}" + (f" (previous copy: {saved})" if saved else ""))
+    else:
+        print("Usage: python backup.py snapshot | list | restore <snapshot>")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Задержка обработчиков во время онлайн-бэкапа (backup.py).
+
+На временной базе с N отзывами цикл, похожий на обработчик (запись отзыва
+через соединение бота раз в несколько мс), замеряется три раза:
+- без бэкапа;
+- во время snapshot() через то же соединение (так делает бот);
+- во время snapshot_separate() с отдельного соединения (CLI, cluster.py).
+
+Задержка одной итерации = опоздание пробуждения event loop + сама запись,
+т.е. то, что почувствовал бы гость. Код возврата 1, если p99 во время бэкапа
+выходит за бюджет или бэкап не уложился в --timeout.
+
+    python bench_backup.py
+    python bench_backup.py --rows 300000 --max-p99-ms 15
+"""
+from __future__ import annotations
+import argparse, asyncio, os, sys, tempfile, time
+from typing import List
+
+from backup import snapshot, snapshot_separate
+from db import get_conn, init_db, now_ts
+
+TICK = 0.002
+
+def _fill(conn, rows: int):
+    with conn:
+        conn.executemany(
+            "INSERT INTO feedback(tg_user_id, visit_id, service, taste, speed, clean, comment, created_at) "
+            "VALUES(?,?,?,?,?,?,?,?)",
+            ((i, f"bench-{i}", 5, 4, 5, 4, "Всё понравилось, спасибо! " * 3, now_ts()) for i in range(rows))
+        )
+
+def _percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+async def _handler_loop(conn, stop: asyncio.Event, latencies: List[float]):
+    n = 0
+    while not stop.is_set():
+        due = time.perf_counter() + TICK
+        await asyncio.sleep(TICK)
+        n += 1
+        with conn:
+            conn.execute(
+                "INSERT INTO feedback(tg_user_id, visit_id, service, taste, speed, clean, created_at) "
+                "VALUES(?,?,?,?,?,?,?)",
+                (-n, f"load-{os.getpid()}-{time.time_ns()}", 5, 5, 5, 5, now_ts())
+            )
+        latencies.append(time.perf_counter() - due)
+
+async def _measure(conn, job, timeout: float):
+    """(задержки, время job или None, если не уложился в timeout)."""
+    stop, latencies = asyncio.Event(), []
+    loop_task = asyncio.create_task(_handler_loop(conn, stop, latencies))
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(job(), timeout)
+        elapsed = time.perf_counter() - started
+    except asyncio.TimeoutError:
+        elapsed = None
+    stop.set()
+    await loop_task
+    return latencies, elapsed
+
+def _report(name: str, latencies: List[float], elapsed) -> float:
+    p50, p99, worst = (_percentile(latencies, p) * 1000 for p in (0.5, 0.99, 1.0))
+    took = f"{elapsed:.2f} с" if elapsed is not None else "НЕ ЗАВЕРШИЛСЯ"
+    print(f"{name:<22} {took:>14}  p50 {p50:5.2f} мс • p99 {p99:5.2f} мс • max {worst:6.2f} мс  ({len(latencies)} записей)")
+    return p99
+
+async def _run(args, tmp: str) -> List[str]:
+    conn = get_conn(os.path.join(tmp, "bot.db"))
+    init_db(conn)
+    _fill(conn, args.rows)
+    size = os.path.getsize(os.path.join(tmp, "bot.db"))
+    print(f"База: {args.rows} отзывов, {size / 1048576:.1f} МБ")
+
+    backups = os.path.join(tmp, "backups")
+    other = get_conn(os.path.join(tmp, "bot.db"))
+    base, _ = await _measure(conn, lambda: asyncio.sleep(args.baseline), args.baseline + 1)
+    same, same_t = await _measure(conn, lambda: snapshot(conn, backups), args.timeout)
+    sep, sep_t = await _measure(conn, lambda: snapshot_separate(other, backups), args.timeout)
+    other.close()
+    conn.close()
+
+    p99_base = _report("без бэкапа", base, args.baseline)
+    failed = []
+    for name, lat, took in (("snapshot()", same, same_t), ("snapshot_separate()", sep, sep_t)):
+        p99 = _report(name, lat, took)
+        if took is None:
+            failed.append(f"{name} не завершился за {args.timeout:g} с")
+        budget = max(args.max_p99_ms, p99_base * args.max_ratio)
+        if p99 > budget:
+            failed.append(f"{name}: p99 {p99:.2f} мс > {budget:.2f} мс")
+    return failed
+
+def main(argv: List[str]):
+    ap = argparse.ArgumentParser(description="Handler latency during online backup")
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--baseline", type=float, default=3, help="длительность замера без бэкапа, с")
+    ap.add_argument("--timeout", type=float, default=60, help="бюджет на один снимок, с")
+    ap.add_argument("--max-p99-ms", type=float, default=10, help="бюджет p99 во время бэкапа, мс")
+    ap.add_argument("--max-ratio", type=float, default=3, help="…или во столько раз выше p99 без бэкапа")
+    args = ap.parse_args(argv[1:])
+
+    with tempfile.TemporaryDirectory(prefix="bench-backup-") as tmp:
+        failed = asyncio.run(_run(args, tmp))
+    for msg in failed:
+        print("FAIL: " + msg)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main(sys.argv)
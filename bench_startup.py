@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Замер холодного старта бота: импорт app.py и время до первого апдейта.
+
+Каждый замер — новый процесс на пустой временной базе и поддельном Bot
+(как в replay.py), в Telegram ничего не уходит:
+- `python -X importtime -c "import app"`: время импорта своих модулей и
+  сторонних пакетов по отдельности, плюс проверка, что модули из LAZY не
+  загружаются при старте. В «свои» входит и исполнение тела app.py:
+  создание Bot (SSL-контекст aiohttp), регистрация хендлеров, открытие базы;
+- время от запуска интерпретатора до обработки первого /start.
+
+Код возврата 1, если превышен бюджет — скрипт можно ставить в CI.
+
+    python bench_startup.py                      # 3 прогона, медиана
+    python bench_startup.py --runs 5 --max-own-ms 60 --max-ttfu 4
+"""
+from __future__ import annotations
+import argparse, os, statistics, subprocess, sys, tempfile, time
+from typing import Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OWN = {f[:-3] for f in os.listdir(HERE) if f.endswith(".py")}
+
+# Не нужны, чтобы принять первый апдейт: грузятся по требованию
+# (gzip тянет за собой recorder, multiprocessing — cluster)
+LAZY = {"dotenv", "backup", "recorder", "gzip", "cluster", "multiprocessing"}
+
+FIRST_UPDATE = """
+import asyncio, time
+import app, replay
+app.bot.session = replay._fake_session()
+update = {"update_id": 1, "message": {
+    "message_id": 1, "date": int(time.time()), "text": "/start",
+    "chat": {"id": 1001, "type": "private"},
+    "from": {"id": 1001, "is_bot": False, "first_name": "Bench"}}}
+asyncio.run(app.dp.feed_raw_update(app.bot, update))
+print("FIRST_UPDATE", time.time(), flush=True)
+"""
+
+def _env(db_path: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(DB_PATH=db_path, BOT_TOKEN="123456:BENCH", RECORD_DIR="", BACKUP_INTERVAL_MIN="0")
+    return env
+
+def _run(code: str, db_path: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=HERE, env=_env(db_path),
+                          capture_output=True, text=True, check=True)
+
+def import_profile(db_path: str) -> Tuple[float, float, float, set]:
+    """(всего, свои модули, сторонние; мс) и множество загруженных модулей."""
+    err = _run("import app", db_path, "-X", "importtime").stderr
+    own = other = 0.0
+    loaded = set()
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        loaded.add(name.split(".")[0])
+        if name.split(".")[0] in OWN:
+            own += int(self_us) / 1000
+        else:
+            other += int(self_us) / 1000
+    return own + other, own, other, loaded
+
+def time_to_first_update(db_path: str) -> float:
+    started = time.time()
+    out = _run(FIRST_UPDATE, db_path).stdout
+    stamp = next(float(l.split()[1]) for l in out.splitlines() if l.startswith("FIRST_UPDATE"))
+    return stamp - started
+
+def main(argv: List[str]):
+    ap = argparse.ArgumentParser(description="Cold start benchmark for app.py")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--max-own-ms", type=float, default=100, help="бюджет импорта своих модулей, мс")
+    ap.add_argument("--max-ttfu", type=float, default=6, help="бюджет времени до первого апдейта, с")
+    args = ap.parse_args(argv[1:])
+
+    profiles, ttfu = [], []
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        for i in range(args.runs):
+            profiles.append(import_profile(os.path.join(tmp, f"import-{i}.db")))
+            ttfu.append(time_to_first_update(os.path.join(tmp, f"first-{i}.db")))
+
+    total, own, other = (statistics.median(p[k] for p in profiles) for k in range(3))
+    eager = sorted(LAZY & set.union(*(p[3] for p in profiles)))
+    first = statistics.median(ttfu)
+    print(f"Импорт app: {total:.0f} мс (свои модули {own:.1f} мс, сторонние пакеты {other:.0f} мс)")
+    print(f"До первого апдейта: {first:.2f} с (min {min(ttfu):.2f}, max {max(ttfu):.2f}, прогонов {args.runs})")
+
+    failed = []
+    if eager:
+        failed.append("при старте загружаются " + ", ".join(eager))
+    if own > args.max_own_ms:
+        failed.append(f"свои модули {own:.1f} мс > {args.max_own_ms:g} мс")
+    if first > args.max_ttfu:
+        failed.append(f"первый апдейт {first:.2f} с > {args.max_ttfu:g} с")
+    for msg in failed:
+        print("FAIL: " + msg)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main(sys.argv)
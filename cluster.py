@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Запуск бота в несколько процессов.
+
+Фронт-процесс забирает апдейты из Telegram и раздаёт их воркерам по
+from_user.id: все апдейты одного гостя попадают к одному воркеру, а там
+UserSerialMiddleware (dispatch.py) обрабатывает их строго по порядку —
+при этом разные гости одного воркера обслуживаются параллельно.
+
+У каждого воркера свой канал (Pipe), которым владеет фронт. Воркер
+подтверждает каждый обработанный апдейт; если он умер, фронт поднимает
+новый процесс на новом канале и повторно отправляет неподтверждённое — по
+одному, чтобы было видно, какой апдейт роняет воркер. Апдейт, отправленный
+MAX_DELIVERIES раз без подтверждения, пишется в лог и отбрасывается.
+Состояние опроса лежит в базе (db.SessionStore), поэтому сессии не теряются,
+а повторно обработанный апдейт отсекают уникальные индексы по визиту.
+
+    WORKERS=4 python cluster.py
+"""
+from __future__ import annotations
+import asyncio, json, logging, os
+import multiprocessing as mp
+from typing import Any, Dict, List
+
+log = logging.getLogger(__name__)
+
+# Как часто фронт проверяет, живы ли воркеры (сек)
+WATCH_INTERVAL = 1.0
+# Сколько раз отправлять апдейт, прежде чем счесть его «ядовитым»
+MAX_DELIVERIES = 3
+
+def shard_of(update: Dict[str, Any], workers: int) -> int:
+    # message / callback_query / edited_message / ... — у всех есть "from"
+    for value in update.values():
+        if isinstance(value, dict):
+            user = value.get("from")
+            if isinstance(user, dict) and "id" in user:
+                return user["id"] % workers
+    return 0
+
+def worker_main(idx: int, pipe):
+    logging.basicConfig(level=logging.INFO)
+    import app  # свой Bot, Dispatcher и соединение с базой в каждом процессе
+    asyncio.run(_worker_loop(idx, app, pipe))
+
+async def _worker_loop(idx: int, app, pipe):
+    loop = asyncio.get_running_loop()
+    log.info("Worker %s started (pid %s)", idx, os.getpid())
+    warm = asyncio.create_task(app.MEMBERSHIP.warm_async(app.conn))
+    handling = set()
+
+    async def handle(raw):
+        try:
+            await app.dp.feed_raw_update(app.bot, raw)
+        except Exception:
+            log.exception("Worker %s: update %s failed", idx, raw.get("update_id"))
+        try:
+            pipe.send(raw.get("update_id"))
+        except OSError:
+            pass  # фронт уже закрыл канал
+
+    while True:
+        try:
+            raw = await loop.run_in_executor(None, pipe.recv)
+        except EOFError:
+            break
+        if raw is None:
+            break
+        # Задача на апдейт, как при обычном polling: медленный вызов Bot API
+        # одного гостя не задерживает остальных
+        task = asyncio.create_task(handle(raw))
+        handling.add(task)
+        task.add_done_callback(handling.discard)
+    await asyncio.gather(*handling)
+    warm.cancel()
+    await app.bot.session.close()
+
+class _Worker:
+    """Процесс-воркер, его канал и апдейты, которые он ещё не подтвердил."""
+    def __init__(self, ctx, idx: int):
+        self.ctx = ctx
+        self.idx = idx
+        # update_id -> апдейт, в порядке отправки
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        # update_id -> сколько раз отправлен (только для неподтверждённых)
+        self.deliveries: Dict[int, int] = {}
+        # после перезапуска: очередь повторной отправки и апдейт, ждущий подтверждения
+        self._backlog: List[int] = []
+        self._resending = None
+        self._start()
+
+    def _start(self):
+        self.pipe, child = self.ctx.Pipe()
+        self.proc = self.ctx.Process(target=worker_main, args=(self.idx, child),
+                                     name=f"worker-{self.idx}", daemon=True)
+        self.proc.start()
+        child.close()
+        asyncio.get_running_loop().add_reader(self.pipe.fileno(), self._on_ack)
+
+    def _on_ack(self):
+        try:
+            update_id = self.pipe.recv()
+            self.pending.pop(update_id, None)
+            self.deliveries.pop(update_id, None)
+            if update_id == self._resending:
+                self._send_next()
+        except (EOFError, OSError):
+            # воркер закрыл канал; перезапуском займётся watch()
+            asyncio.get_running_loop().remove_reader(self.pipe.fileno())
+
+    def _send(self, raw):
+        try:
+            self.pipe.send(raw)
+        except OSError:
+            pass  # воркер умер: апдейт остался в pending и уйдёт после перезапуска
+
+    def put(self, raw: Dict[str, Any]):
+        self.pending[raw["update_id"]] = raw
+        self.deliveries[raw["update_id"]] = 1
+        self._send(raw)
+
+    def restart(self):
+        log.warning("Worker %s exited with %s, restarting (%s unacknowledged)",
+                    self.idx, self.proc.exitcode, len(self.pending))
+        asyncio.get_running_loop().remove_reader(self.pipe.fileno())
+        self.pipe.close()
+        self.proc.join(0)
+        self._start()
+        self._backlog = list(self.pending)
+        self._send_next()
+
+    def _send_next(self):
+        self._resending = None
+        while self._backlog:
+            update_id = self._backlog.pop(0)
+            if update_id not in self.pending:
+                continue
+            if self.deliveries[update_id] >= MAX_DELIVERIES:
+                log.error("Worker %s: dropping update %s after %s deliveries: %s", self.idx, update_id,
+                          MAX_DELIVERIES, json.dumps(self.pending[update_id], ensure_ascii=False))
+                del self.pending[update_id], self.deliveries[update_id]
+                continue
+            self.deliveries[update_id] += 1
+            self._resending = update_id
+            self._send(self.pending[update_id])
+            return
+
+    def stop(self, timeout: float = 5):
+        self._send(None)
+        self.proc.join(timeout)
+
+async def watch(workers: List[_Worker]):
+    while True:
+        await asyncio.sleep(WATCH_INTERVAL)
+        for w in workers:
+            if not w.proc.is_alive():
+                w.restart()
+
+async def front(token: str, workers: List[_Worker]):
+    from aiogram import Bot
+
+    bot = Bot(token)
+    offset = None
+    try:
+        await bot.delete_webhook()
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30)
+            except Exception:
+                log.exception("get_updates failed")
+                await asyncio.sleep(5)
+                continue
+            for u in updates:
+                offset = u.update_id + 1
+                raw = u.model_dump(mode="json", by_alias=True, exclude_none=True)
+                workers[shard_of(raw, len(workers))].put(raw)
+    finally:
+        await bot.session.close()
+
+async def _run_front(token: str, ctx, n: int, conn):
+    workers = [_Worker(ctx, i) for i in range(n)]
+    print(f"Bot started: {n} workers")
+    background = [asyncio.create_task(watch(workers))]
+    interval = int(os.getenv("BACKUP_INTERVAL_MIN", "0"))
+    if interval > 0:
+        from backup import backup_loop
+        # Соединение фронта — не то, через которое пишут воркеры: снимок
+        # одним шагом, иначе запись воркеров перезапускала бы копирование.
+        background.append(asyncio.create_task(backup_loop(
+            conn, os.getenv("BACKUP_DIR", "./backups"), interval, int(os.getenv("BACKUP_KEEP", "7")),
+            separate=True
+        )))
+    try:
+        await front(token, workers)
+    finally:
+        for task in background:
+            task.cancel()
+        for w in workers:
+            w.stop()
+
+def main():
+    from dotenv import load_dotenv
+    from db import get_conn, init_db
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    token = os.getenv("BOT_TOKEN")
+    assert token and token != "8018287894:REPLACE_ME", "Заполните BOT_TOKEN в .env"
+    workers = int(os.getenv("WORKERS", "2"))
+
+    # Схема создаётся один раз до старта воркеров
+    conn = get_conn(os.getenv("DB_PATH", "./bot.db"))
+    init_db(conn)
+
+    try:
+        asyncio.run(_run_front(token, mp.get_context("spawn"), workers, conn))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,274 @@
 import sqlite3
 from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
 
 def get_conn(db_path: str):
     conn = sqlite3.connect(db_path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db(conn):
-    with closing(conn.cursor()) as cur:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS guests (
-            tg_user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            phone TEXT,
-            created_at TEXT
-        )""")
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS visits (
-            visit_id TEXT PRIMARY KEY,
-            tg_user_id INTEGER,
-            created_at TEXT
-        )""")
+# Время хранится как INTEGER — микросекунды от эпохи UTC: 8 байт вместо ~26
+# байт ISO-строки, и datetime восстанавливается без потерь (CSV-экспорт тот же).
+EPOCH = datetime(1970, 1, 1)
+SCHEMA_VERSION = 3
+
+def to_ts(dt: datetime) -> int:
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+def from_ts(ts: int) -> datetime:
+    return EPOCH + timedelta(microseconds=ts)
+
+def now_ts() -> int:
+    return to_ts(datetime.utcnow())
+
+def ts_iso(ts: Optional[int]) -> Optional[str]:
+    return from_ts(ts).isoformat() if ts is not None else None
+
+def init_db(conn) -> Optional[str]:
+    """Создаёт или обновляет схему. Возвращает путь к копии старой базы,
+    если она делалась перед миграцией (см. backup_before_migration)."""
+    # WAL: читатели не блокируют писателя — нужно, когда с базой работают
+    # несколько процессов (cluster.py)
+    conn.execute("PRAGMA journal_mode=WAL")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return None
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='prizes'").fetchone()
+    copy = backup_before_migration(conn) if legacy and version < 2 else None
+    conn.execute("BEGIN")
+    try:
+        with closing(conn.cursor()) as cur:
+            if version < 2:
+                if legacy:
+                    _migrate_v1(conn, cur)
+                else:
+                    _create_schema(cur)
+                version = 2
+            if _add_search(cur):
+                version = 3
+            cur.execute(f"PRAGMA user_version={version}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return copy
+
+def backup_before_migration(conn) -> Optional[str]:
+    """Копия старой базы рядом с ней (<db>.v1) перед переводом на новую схему.
+    Для базы в памяти копии нет — возвращается None."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not path:
+        return None
+    dst = sqlite3.connect(path + ".v1")
+    try:
+        conn.backup(dst)
+    finally:
+        dst.close()
+    return path + ".v1"
+
+def _create_schema(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS guests (
+        tg_user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        phone TEXT,
+        created_at INTEGER
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS visits (
+        visit_id TEXT PRIMARY KEY,
+        tg_user_id INTEGER,
+        created_at INTEGER
+    ) WITHOUT ROWID""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tg_user_id INTEGER,
+        visit_id TEXT,
+        service INTEGER,
+        taste INTEGER,
+        speed INTEGER,
+        clean INTEGER,
+        comment TEXT,
+        photo_id TEXT,
+        created_at INTEGER,
+        alert_sent INTEGER DEFAULT 0,
+        duplicate INTEGER NOT NULL DEFAULT 0
+    )""")
+    # Названия призов хранятся один раз, в prizes — только ссылка
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS prize_catalog (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        type TEXT NOT NULL,
+        UNIQUE(title, type)
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS prizes (
+        code TEXT PRIMARY KEY,
+        prize_id INTEGER REFERENCES prize_catalog(id),
+        valid_until INTEGER,
+        user_id INTEGER,
+        visit_id TEXT,
+        status TEXT,
+        created_at INTEGER,
+        redeemed_at INTEGER,
+        redeemed_by INTEGER
+    ) WITHOUT ROWID""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sessions (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at INTEGER
+    ) WITHOUT ROWID""")
+    # Покрывающий индекс для /stats: выборка за период не читает саму таблицу
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_feedback_created ON feedback(created_at, service, taste, speed, clean)")
+    # Один отзыв и один приз на визит (отзывы без визита и старые дубли не ограничены).
+    # Поиск по визиту использует эти индексы, только если в запросе есть то же
+    # условие: visit_id=? AND visit_id <> '' AND duplicate = 0 (см. app.py).
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_feedback_visit ON feedback(visit_id) "
+        "WHERE visit_id <> '' AND duplicate = 0"
+    )
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_prizes_visit ON prizes(visit_id) "
+        "WHERE visit_id <> '' AND status <> 'duplicate'"
+    )
+
+def _add_search(cur) -> bool:
+    """Полнотекстовый индекс комментариев (v3) + заполнение по существующим
+    отзывам. Без FTS5 в SQLite возвращает False: /search отключён, попытка
+    повторится при следующем старте.
+
+    unicode61 не снимает диакритику с кириллицы, поэтому индексируется текст
+    с ё -> е (представление feedback_search); запрос нормализуется так же.
+    """
+    cur.execute("""
+    CREATE VIEW IF NOT EXISTS feedback_search AS
+    SELECT id, replace(replace(comment, 'ё', 'е'), 'Ё', 'Е') AS comment FROM feedback""")
+    try:
         cur.execute("""
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_user_id INTEGER,
-            visit_id TEXT,
-            service INTEGER,
-            taste INTEGER,
-            speed INTEGER,
-            clean INTEGER,
-            comment TEXT,
-            photo_id TEXT,
-            created_at TEXT,
-            alert_sent INTEGER DEFAULT 0
+        CREATE VIRTUAL TABLE feedback_fts USING fts5(
+            comment,
+            content='feedback_search', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
         )""")
+    except sqlite3.OperationalError:
+        return False
+    cur.execute("""
+    CREATE TRIGGER feedback_fts_ai AFTER INSERT ON feedback BEGIN
+        INSERT INTO feedback_fts(rowid, comment) VALUES (new.id, replace(replace(new.comment, 'ё', 'е'), 'Ё', 'Е'));
+    END""")
+    cur.execute("""
+    CREATE TRIGGER feedback_fts_ad AFTER DELETE ON feedback BEGIN
+        INSERT INTO feedback_fts(feedback_fts, rowid, comment)
+        VALUES ('delete', old.id, replace(replace(old.comment, 'ё', 'е'), 'Ё', 'Е'));
+    END""")
+    cur.execute("""
+    CREATE TRIGGER feedback_fts_au AFTER UPDATE OF comment ON feedback BEGIN
+        INSERT INTO feedback_fts(feedback_fts, rowid, comment)
+        VALUES ('delete', old.id, replace(replace(old.comment, 'ё', 'е'), 'Ё', 'Е'));
+        INSERT INTO feedback_fts(rowid, comment) VALUES (new.id, replace(replace(new.comment, 'ё', 'е'), 'Ё', 'Е'));
+    END""")
+    cur.execute("INSERT INTO feedback_fts(feedback_fts) VALUES ('rebuild')")
+    return True
+
+def _iso_to_ts(value):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return to_ts(datetime.fromisoformat(value))
+    except ValueError:
+        return None
+
+def _migrate_v1(conn, cur):
+    """Старая схема (ISO-строки, название приза в каждой строке prizes) -> v2.
+
+    Дубли по визиту, накопившиеся до уникальных индексов, сохраняются: визит
+    остаётся за самой ранней записью, остальные отзывы получают duplicate=1,
+    лишние призы — статус 'duplicate'. Исходная база до миграции копируется
+    в <db>.v1 (init_db).
+    """
+    conn.create_function("iso_to_ts", 1, _iso_to_ts, deterministic=True)
+    tables = {r[0] for r in cur.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    cur.execute("DROP INDEX IF EXISTS ux_feedback_visit")
+    cur.execute("DROP INDEX IF EXISTS ux_prizes_visit")
+    for name in ("guests", "visits", "feedback", "prizes", "sessions"):
+        if name in tables:
+            cur.execute(f"ALTER TABLE {name} RENAME TO {name}_v1")
+    _create_schema(cur)
+
+    cur.execute("""
+    INSERT INTO guests(tg_user_id, username, phone, created_at)
+    SELECT tg_user_id, username, phone, iso_to_ts(created_at) FROM guests_v1""")
+    cur.execute("""
+    INSERT INTO visits(visit_id, tg_user_id, created_at)
+    SELECT visit_id, tg_user_id, iso_to_ts(created_at) FROM visits_v1 WHERE visit_id IS NOT NULL""")
+    cur.execute("""
+    INSERT INTO feedback(id, tg_user_id, visit_id, service, taste, speed, clean, comment, photo_id, created_at,
+                         alert_sent, duplicate)
+    SELECT id, tg_user_id, visit_id, service, taste, speed, clean, comment, photo_id, iso_to_ts(created_at),
+           alert_sent,
+           coalesce(visit_id, '') <> '' AND id NOT IN (SELECT min(id) FROM feedback_v1 GROUP BY visit_id)
+    FROM feedback_v1""")
+    cur.execute("""
+    INSERT OR IGNORE INTO prize_catalog(title, type)
+    SELECT DISTINCT coalesce(title, ''), coalesce(type, '') FROM prizes_v1""")
+    cur.execute("""
+    INSERT INTO prizes(code, prize_id, valid_until, user_id, visit_id, status, created_at, redeemed_at, redeemed_by)
+    SELECT p.code, c.id, iso_to_ts(p.valid_until), p.user_id, p.visit_id,
+           CASE WHEN coalesce(p.visit_id, '') = ''
+                  OR p.rowid IN (SELECT min(rowid) FROM prizes_v1 WHERE status <> 'duplicate' GROUP BY visit_id)
+                THEN p.status ELSE 'duplicate' END,
+           iso_to_ts(p.created_at), iso_to_ts(p.redeemed_at), p.redeemed_by
+    FROM prizes_v1 p
+    JOIN prize_catalog c ON c.title = coalesce(p.title, '') AND c.type = coalesce(p.type, '')""")
+    if "sessions" in tables:
         cur.execute("""
-        CREATE TABLE IF NOT EXISTS prizes (
-            code TEXT PRIMARY KEY,
-            title TEXT,
-            type TEXT,
-            valid_until TEXT,
-            user_id INTEGER,
-            visit_id TEXT,
-            status TEXT,
-            created_at TEXT,
-            redeemed_at TEXT,
-            redeemed_by INTEGER
-        )""")
-        conn.commit()
+        INSERT INTO sessions(key, value, updated_at)
+        SELECT key, value, iso_to_ts(updated_at) FROM sessions_v1""")
+    for name in ("guests", "visits", "feedback", "prizes", "sessions"):
+        cur.execute(f"DROP TABLE IF EXISTS {name}_v1")
+
+_CATALOG: Dict[Tuple[str, str], int] = {}
+
+def catalog_id(conn, title: str, type_: str) -> int:
+    """id приза в prize_catalog (добавляется при первом обращении)."""
+    key = (title, type_)
+    if key not in _CATALOG:
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO prize_catalog(title, type) VALUES(?,?)", key)
+        _CATALOG[key] = conn.execute(
+            "SELECT id FROM prize_catalog WHERE title=? AND type=?", key
+        ).fetchone()[0]
+    return _CATALOG[key]
+
+class SessionStore:
+    """Состояние опроса (текущий визит гостя) в таблице sessions.
+
+    Повторяет нужную часть интерфейса dict, но переживает перезапуск процесса
+    и видно всем воркерам cluster.py.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM sessions WHERE key=?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def __setitem__(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO sessions(key, value, updated_at) VALUES(?,?,?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
+                (key, value, now_ts())
+            )
+
+    def pop(self, key: str, default=None):
+        with self.conn:
+            row = self.conn.execute("SELECT value FROM sessions WHERE key=?", (key,)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM sessions WHERE key=?", (key,))
+        return row["value"] if row else default
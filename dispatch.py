@@ -0,0 +1,34 @@
+"""Порядок обработки апдейтов.
+
+aiogram обрабатывает каждый апдейт в отдельной задаче, поэтому два быстрых
+сообщения одного гостя могут выполняться одновременно. UserSerialMiddleware
+выстраивает апдейты одного пользователя в очередь (asyncio.Lock отдаёт
+владение в порядке ожидания, т.е. в порядке прихода), а апдейты разных
+пользователей по-прежнему идут параллельно.
+"""
+from __future__ import annotations
+import asyncio
+from typing import Dict, List
+
+class UserSerialMiddleware:
+    def __init__(self):
+        # user_id -> [lock, число апдейтов в работе]; запись удаляется,
+        # когда у пользователя не остаётся апдейтов
+        self._slots: Dict[int, List] = {}
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        slot = self._slots.get(user.id)
+        if slot is None:
+            slot = self._slots[user.id] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                return await handler(event, data)
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._slots[user.id]
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Кэш принадлежности: известные гости и визиты, по которым уже есть отзыв.
+
+Прогревается из базы после старта (в фоне, warm_async) и дополняется при
+записи, так что большинство /start обходятся без запросов к базе:
+- гости — точное множество id: «известен» означает, что строка в guests есть;
+  размер ограничен guests_max (самые недавние гости), остальные проверяются
+  запросом к базе;
+- использованные визиты — фильтр Блума в заданном бюджете памяти: «нет»
+  точно, «возможно да» проверяется запросом (ложные срабатывания считаются).
+
+Кэш локален для процесса. В cluster.py гость всегда попадает на один воркер;
+визит, использованный через другой воркер, фильтр может пропустить — такой
+повтор отсекает уникальный индекс feedback(visit_id). Пока кэш не прогрет,
+он ничего не утверждает: все проверки идут в базу.
+
+    python membership.py    # прогрев из DB_PATH и замер доли ложных срабатываний
+"""
+from __future__ import annotations
+import asyncio, hashlib, itertools, math, os, sys
+from typing import Dict, List, Set, Tuple
+
+class BloomFilter:
+    def __init__(self, size_bytes: int, expected_items: int):
+        self.bits = bytearray(max(size_bytes, 8))
+        self.m = len(self.bits) * 8
+        # оптимальное число хеш-функций k = m/n * ln 2
+        self.k = min(16, max(1, round(self.m / max(expected_items, 1) * math.log(2))))
+        self.count = 0
+
+    def _positions(self, key: str):
+        d = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, key: str):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def expected_fp_rate(self) -> float:
+        return (1 - math.exp(-self.k * self.count / self.m)) ** self.k
+
+class MembershipCache:
+    def __init__(self, bloom_bytes: int = 1 << 20, guests_max: int = 100_000):
+        self.bloom_bytes = bloom_bytes
+        self.guests_max = guests_max
+        self.guests: Set[int] = set()
+        # гостей больше, чем guests_max: часть из них кэш не знает
+        self.guests_capped = False
+        self.visits = BloomFilter(bloom_bytes, 10_000)
+        # проверки визитов: ответ фильтра «нет» / «возможно» / «возможно», но в базе нет
+        self.negatives = 0
+        self.positives = 0
+        self.false_positives = 0
+        self.ready = False
+        # визиты, записанные во время прогрева: войдут в фильтр после него
+        self._pending: List[str] = []
+
+    def _load(self, conn) -> Tuple[List[int], BloomFilter]:
+        # на одного больше лимита — чтобы понять, все ли гости поместились
+        guests = [r[0] for r in conn.execute(
+            "SELECT tg_user_id FROM guests ORDER BY created_at DESC LIMIT ?", (self.guests_max + 1,))]
+        used = [r[0] for r in conn.execute("SELECT DISTINCT visit_id FROM feedback WHERE visit_id <> ''")]
+        # запас на рост, чтобы доля ложных срабатываний не росла сразу после старта
+        visits = BloomFilter(self.bloom_bytes, max(2 * len(used), 10_000))
+        for visit_id in used:
+            visits.add(visit_id)
+        return guests, visits
+
+    def _apply(self, guests: List[int], visits: BloomFilter):
+        room = self.guests_max - len(self.guests)
+        self.guests.update(itertools.islice(guests, max(room, 0)))
+        self.guests_capped = self.guests_capped or len(guests) > room
+        for visit_id in self._pending:
+            visits.add(visit_id)
+        self._pending.clear()
+        self.visits = visits
+        self.ready = True
+
+    def warm(self, conn):
+        self._apply(*self._load(conn))
+
+    async def warm_async(self, conn):
+        """Прогрев в потоке на отдельном соединении: цикл событий не блокируется."""
+        from db import get_conn
+
+        path = conn.execute("PRAGMA database_list").fetchone()[2]
+        if not path:  # :memory: — другое соединение базу не увидит
+            return self.warm(conn)
+
+        def load():
+            reader = get_conn(path)
+            try:
+                return self._load(reader)
+            finally:
+                reader.close()
+
+        self._apply(*await asyncio.to_thread(load))
+
+    def known_guest(self, user_id: int) -> bool:
+        return user_id in self.guests
+
+    def add_guest(self, user_id: int):
+        if len(self.guests) < self.guests_max:
+            self.guests.add(user_id)
+        else:
+            self.guests_capped = True
+
+    def maybe_used_visit(self, visit_id: str) -> bool:
+        if not self.ready:
+            return True
+        if visit_id in self.visits:
+            self.positives += 1
+            return True
+        self.negatives += 1
+        return False
+
+    def add_used_visit(self, visit_id: str):
+        if visit_id:
+            self.visits.add(visit_id)
+            if not self.ready:
+                self._pending.append(visit_id)
+
+    def false_positive(self):
+        if self.ready:
+            self.false_positives += 1
+
+    def stats(self) -> Dict[str, float]:
+        unused = self.negatives + self.false_positives
+        return {
+            "guests": len(self.guests),
+            "guests_max": self.guests_max,
+            "guests_capped": self.guests_capped,
+            "visits": self.visits.count,
+            "bloom_bytes": len(self.visits.bits),
+            "bloom_k": self.visits.k,
+            "guests_bytes": sys.getsizeof(self.guests) + 28 * len(self.guests),
+            "fp_expected": self.visits.expected_fp_rate(),
+            "fp_measured": self.false_positives / unused if unused else 0.0,
+        }
+
+def main():
+    from dotenv import load_dotenv
+    from db import get_conn
+
+    load_dotenv()
+    conn = get_conn(os.getenv("DB_PATH", "./bot.db"))
+    cache = MembershipCache(int(os.getenv("MEMBERSHIP_BLOOM_BYTES", str(1 << 20))),
+                            int(os.getenv("MEMBERSHIP_GUESTS_MAX", "100000")))
+    cache.warm(conn)
+    used = {r[0] for r in conn.execute("SELECT DISTINCT visit_id FROM feedback")}
+    probes = 100_000
+    fp = sum(f"probe-{i}" in cache.visits for i in range(probes) if f"probe-{i}" not in used)
+    s = cache.stats()
+    print(f"Гостей: {s['guests']} из лимита {s['guests_max']} (~{s['guests_bytes'] // 1024} КБ), "
+          f"визитов: {s['visits']}, фильтр: {s['bloom_bytes'] // 1024} КБ, k={s['bloom_k']}")
+    if s["guests_capped"]:
+        total = conn.execute("SELECT COUNT(*) FROM guests").fetchone()[0]
+        print(f"Лимит гостей достигнут: {total - s['guests']} из {total} проверяются запросом к базе "
+              f"(MEMBERSHIP_GUESTS_MAX)")
+    print(f"Ложные срабатывания: расчётно {s['fp_expected']:.2e}, на {probes} пробах {fp / probes:.2e}")
+
+if __name__ == "__main__":
+    main()
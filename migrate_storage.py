@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Перевод bot.db на компактный формат хранения (схема v2).
+
+Бот делает то же самое сам при старте (init_db), включая копию исходной
+базы в <db>.v1; скрипт дополнительно выполняет VACUUM и печатает размер
+таблиц и индексов и скорость выборки отзывов за период (как в /stats) до и после.
+Полнотекстовый индекс (feedback_fts*, схема v3) в размер не входит:
+сравнивается только формат хранения.
+
+    python migrate_storage.py [DB_PATH]
+"""
+from __future__ import annotations
+import os, sqlite3, sys, time
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta
+
+from db import get_conn, init_db, to_ts
+
+# Версия схемы, с которой время хранится целыми числами
+STORAGE_VERSION = 2
+
+def _file_size(conn) -> int:
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+def _sizes(conn) -> Optional[Dict[str, Tuple[str, int]]]:
+    """Байты по таблицам и индексам: {имя: (table|index, байты)}, без
+    служебных sqlite_* и полнотекстового индекса. None, если SQLite собран
+    без dbstat."""
+    try:
+        rows = conn.execute(
+            "SELECT m.name, m.type, sum(d.pgsize) FROM dbstat d JOIN sqlite_master m ON m.name = d.name "
+            "WHERE m.name NOT LIKE 'sqlite\\_%' ESCAPE '\\' AND m.name NOT LIKE 'feedback\\_fts%' ESCAPE '\\' "
+            "GROUP BY m.name"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    return {name: (kind, size) for name, kind, size in rows}
+
+def _kb(size: int) -> str:
+    return f"{size / 1024:.0f} КБ"
+
+def _report_sizes(before, after, file_before: int, file_after: int):
+    if before is None or after is None:
+        print(f"Размер файла: {_kb(file_before)} -> {_kb(file_after)} (SQLite без dbstat, вместе с индексами)")
+        return
+    for name in sorted(n for n, (kind, _) in before.items() if kind == "table"):
+        if name in after:
+            b, a = before[name][1], after[name][1]
+            print(f"  {name}: {_kb(b)} -> {_kb(a)} ({a / b:.0%})")
+    total = lambda sizes, kind: sum(size for k, size in sizes.values() if k == kind)
+    b, a = total(before, "table"), total(after, "table")
+    print(f"Таблицы: {_kb(b)} -> {_kb(a)} ({a / b:.0%})")
+    new = sorted(n for n, (kind, _) in after.items() if kind == "index" and n not in before)
+    print(f"Индексы: {_kb(total(before, 'index'))} -> {_kb(total(after, 'index'))}"
+          + (f" (новые: {', '.join(new)})" if new else ""))
+
+def _range_scan_ms(conn, since, repeat: int = 20) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        conn.execute(
+            "SELECT COUNT(*), avg(service), avg(taste), avg(speed), avg(clean) FROM feedback WHERE created_at >= ?",
+            (since,)
+        ).fetchone()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+def main(argv):
+    from dotenv import load_dotenv
+    load_dotenv()
+    db_path = argv[1] if len(argv) > 1 else os.getenv("DB_PATH", "./bot.db")
+    conn = get_conn(db_path)
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= STORAGE_VERSION:
+        print(f"{db_path}: формат уже актуален")
+        return
+
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='feedback'").fetchone():
+        init_db(conn)
+        conn.close()
+        print(f"{db_path}: база пустая, создана схема — сравнивать нечего")
+        return
+
+    since = datetime.utcnow() - timedelta(days=30)
+    sizes_before, file_before = _sizes(conn), _file_size(conn)
+    scan_before = _range_scan_ms(conn, since.isoformat())
+
+    copy = init_db(conn)
+    conn.execute("VACUUM")
+
+    sizes_after, file_after = _sizes(conn), _file_size(conn)
+    scan_after = _range_scan_ms(conn, to_ts(since))
+    conn.close()
+
+    if copy:
+        print(f"Копия исходной базы: {copy}")
+    _report_sizes(sizes_before, sizes_after, file_before, file_after)
+    print(f"Отзывы за 30 дней: {scan_before:.2f} мс -> {scan_after:.2f} мс")
+
+if __name__ == "__main__":
+    main(sys.argv)
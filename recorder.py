@@ -0,0 +1,77 @@
+"""Запись входящих апдейтов для последующего воспроизведения (replay.py).
+
+Каждый апдейт пишется строкой JSON {"t": <время прихода>, "u": <апдейт>}
+в сжатый лог updates-<pid>-<YYYYmmdd-HHMMSS>.jsonl.gz; при достижении
+max_bytes начинается новый файл, старые сверх keep удаляются — только файлы
+своего процесса: в cluster.py соседние воркеры ещё пишут в свои.
+"""
+from __future__ import annotations
+import gzip, json, os, time
+from datetime import datetime
+from typing import Any, Dict, List
+
+PREFIX = "updates-"
+SUFFIX = ".jsonl.gz"
+
+class UpdateRecorder:
+    def __init__(self, directory: str, max_bytes: int = 16 << 20, keep: int = 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._raw = None
+        self._gz = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        own = f"{PREFIX}{os.getpid()}-"
+        path = os.path.join(self.directory, f"{own}{stamp}{SUFFIX}")
+        self._raw = open(path, "ab")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        mine = [p for p in list_logs(self.directory) if os.path.basename(p).startswith(own)]
+        for old in mine[:-self.keep] if self.keep > 0 else []:
+            os.remove(old)
+
+    def write(self, update: Dict[str, Any], arrived: float | None = None):
+        if self._gz is None:
+            self._open()
+        line = json.dumps({"t": arrived or time.time(), "u": update}, ensure_ascii=False, separators=(",", ":"))
+        self._gz.write(line.encode("utf-8") + b"\n")
+        # sync flush: после падения процесса лог читается до последней записи
+        self._gz.flush()
+        if self._raw.tell() >= self.max_bytes:
+            self.close()
+
+    def close(self):
+        if self._gz is not None:
+            self._gz.close()
+            self._raw.close()
+            self._gz = self._raw = None
+
+def list_logs(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    names = [n for n in os.listdir(directory) if n.startswith(PREFIX) and n.endswith(SUFFIX)]
+    # сортировка по времени создания файла, а не по pid
+    names.sort(key=lambda n: n.rsplit("-", 2)[-2:])
+    return [os.path.join(directory, n) for n in names]
+
+def read_log(path: str):
+    """Записи лога как (t, update). Обрезанная последняя строка пропускается."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break
+                yield rec["t"], rec["u"]
+        except EOFError:
+            return
+
+def recorder_middleware(recorder: UpdateRecorder):
+    """Outer-middleware для dp.update: пишет апдейт до обработки."""
+    async def middleware(handler, event, data):
+        recorder.write(event.model_dump(mode="json", by_alias=True, exclude_none=True))
+        return await handler(event, data)
+    return middleware
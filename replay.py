@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Воспроизведение записанных апдейтов (recorder.py) через диспетчер app.py.
+
+Апдейты прогоняются на отдельной базе с поддельным Bot (в Telegram ничего
+не уходит), призы и коды генерируются от фиксированного seed.
+
+    python replay.py records/updates-*.jsonl.gz                 # как можно быстрее
+    python replay.py LOG --speed 1                              # в реальном времени
+    python replay.py LOG --speed 10 --from-db backups/bot-X.db  # x10, от снимка базы
+    python replay.py LOG --expect replay-prev.db                # сравнить итоговую базу
+"""
+from __future__ import annotations
+import argparse, asyncio, contextvars, os, random, sqlite3, string, sys, tempfile, time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from db import catalog_id
+from recorder import read_log
+
+# Меняются от запуска к запуску и в сравнении баз не участвуют
+VOLATILE_COLUMNS = {"created_at", "updated_at", "valid_until", "redeemed_at"}
+
+# Свой генератор на каждый апдейт (seed + update_id): розыгрыш приза не зависит
+# от того, в каком порядке перемешались апдейты разных гостей
+_RNG: contextvars.ContextVar[random.Random] = contextvars.ContextVar("replay_rng")
+
+def load_records(paths: List[str]) -> List[Tuple[float, Dict[str, Any]]]:
+    records = [rec for path in paths for rec in read_log(path)]
+    records.sort(key=lambda r: r[0])
+    return records
+
+def _fake_session():
+    from typing import get_args
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message, User
+
+    class FakeSession(BaseSession):
+        """Отвечает на любой метод Bot API правдоподобным ответом."""
+        def __init__(self):
+            super().__init__()
+            self.calls: Counter = Counter()
+            self._message_id = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[type(method).__name__] += 1
+            returning = method.__returning__
+            if returning is User:
+                return User(id=bot.id, is_bot=True, first_name="replay", username="replay_bot")
+            if returning is Message or Message in get_args(returning):
+                chat_id = getattr(method, "chat_id", None)
+                self._message_id += 1
+                return Message(
+                    message_id=self._message_id,
+                    date=datetime.utcnow(),
+                    chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+                    text=getattr(method, "text", None),
+                )
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return FakeSession()
+
+def _prepare_db(path: str, from_db: str | None):
+    if from_db:
+        src, dst = sqlite3.connect(from_db), sqlite3.connect(path)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+    elif os.path.exists(path) and os.path.getsize(path):
+        raise SystemExit(f"{path} уже существует: укажите пустой путь или --from-db")
+
+def _import_app(db_path: str):
+    os.environ["DB_PATH"] = db_path
+    os.environ["RECORD_DIR"] = ""
+    os.environ.setdefault("BOT_TOKEN", "123456:REPLAY")
+    import app
+
+    alphabet = string.ascii_uppercase + string.digits
+    app.gen_code = lambda prefix="RB-": prefix + "".join(_RNG.get().choice(alphabet) for _ in range(7))
+    app.weighted_choice = lambda items: _RNG.get().choices(items, weights=[i["weight"] for i in items])[0]
+    app.bot.session = _fake_session()
+    app.MEMBERSHIP.warm(app.conn)
+    # id в prize_catalog — в порядке пула, а не в порядке первых розыгрышей
+    for p in app.DEFAULT_PRIZES:
+        catalog_id(app.conn, p["title"], p["type"])
+    return app
+
+async def replay(app, records, speed: float, seed: int = 0):
+    latencies: List[float] = []
+    errors = 0
+
+    async def feed(raw):
+        nonlocal errors
+        _RNG.set(random.Random(f"{seed}:{raw.get('update_id')}"))
+        started = time.perf_counter()
+        try:
+            await app.dp.feed_raw_update(app.bot, raw)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    loop = asyncio.get_running_loop()
+    tasks = []
+    first = records[0][0] if records else 0
+    start = loop.time()
+    for t, raw in records:
+        if speed > 0:
+            delay = (t - first) / speed - (loop.time() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(feed(raw)))
+    await asyncio.gather(*tasks)
+    return loop.time() - start, latencies, errors
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def _tables(conn) -> set:
+    """Таблицы с данными: без служебных sqlite_*, виртуальных таблиц и их
+    теневых таблиц (feedback_fts_data и т.п.) — это производные индекса,
+    их содержимое зависит от порядка вставки, а не от итоговых данных."""
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()
+    virtual = [name for name, sql in rows if (sql or "").upper().startswith("CREATE VIRTUAL TABLE")]
+    return {name for name, _ in rows if not any(name == v or name.startswith(v + "_") for v in virtual)}
+
+def _table_rows(conn, table: str) -> Counter:
+    # id с AUTOINCREMENT зависит от порядка вставки — сравниваются сами строки
+    autoinc = "AUTOINCREMENT" in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name=?", (table,)).fetchone()[0].upper()
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")
+            if r[1] not in VOLATILE_COLUMNS and not (autoinc and r[5])]
+    return Counter(tuple(r) for r in conn.execute(f"SELECT {','.join(cols)} FROM {table}"))
+
+def diff_db(actual: str, expected: str) -> int:
+    """Печатает различия по таблицам, возвращает число различающихся строк."""
+    a, b = sqlite3.connect(actual), sqlite3.connect(expected)
+    ta, tb = _tables(a), _tables(b)
+    total = 0
+    for table in sorted(ta | tb):
+        if table not in ta or table not in tb:
+            print(f"  {table}: есть только в {'replay' if table in ta else 'expected'}")
+            total += 1
+            continue
+        ra, rb = _table_rows(a, table), _table_rows(b, table)
+        extra, missing = ra - rb, rb - ra
+        n = sum(extra.values()) + sum(missing.values())
+        total += n
+        print(f"  {table}: {sum(ra.values())} vs {sum(rb.values())} строк"
+              + (f", лишних {sum(extra.values())}, недостающих {sum(missing.values())}" if n else ", совпадает"))
+        for row in list(extra)[:3]:
+            print(f"    + {row}")
+        for row in list(missing)[:3]:
+            print(f"    - {row}")
+    a.close()
+    b.close()
+    return total
+
+def main(argv: List[str]):
+    ap = argparse.ArgumentParser(description="Replay recorded updates through app.py")
+    ap.add_argument("logs", nargs="+")
+    ap.add_argument("--speed", type=float, default=0, help="1 — реальное время, N — в N раз быстрее, 0 — без пауз")
+    ap.add_argument("--db", help="рабочая база (по умолчанию временный файл)")
+    ap.add_argument("--from-db", help="начальное состояние базы, например снимок из backups/")
+    ap.add_argument("--expect", help="база для сравнения итогового состояния")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv[1:])
+
+    db_path = args.db or tempfile.mkstemp(prefix="replay-", suffix=".db")[1]
+    _prepare_db(db_path, args.from_db)
+    records = load_records(args.logs)
+    app = _import_app(db_path)
+
+    elapsed, latencies, errors = asyncio.run(replay(app, records, args.speed, args.seed))
+    app.conn.close()
+
+    print(f"Апдейтов: {len(records)}, ошибок: {errors}, время: {elapsed:.2f} с, "
+          f"{len(records) / elapsed if elapsed else 0:.1f} апд/с")
+    print("Задержка, мс: p50 {:.1f} • p95 {:.1f} • p99 {:.1f} • max {:.1f}".format(
+        *(_percentile(latencies, p) * 1000 for p in (0.5, 0.95, 0.99, 1.0))))
+    print("Вызовы Bot API: " + ", ".join(f"{k} {v}" for k, v in app.bot.session.calls.most_common()))
+    print(f"База: {db_path}")
+    if args.expect:
+        print(f"Сравнение с {args.expect}:")
+        if diff_db(db_path, args.expect):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,81 @@
+"""Полнотекстовый поиск по комментариям гостей (FTS5, таблица feedback_fts).
+
+Индекс ведут триггеры на feedback (см. db._add_search). Токенизатор
+unicode61 приводит регистр, но ё с кириллицы не снимает, поэтому и индекс,
+и запрос строятся по тексту с ё → е. Морфологию заменяет грубый стемминг
+запроса: у слова отрезается окончание и ищется префикс — «пиццу» находит
+«пицца», «пиццы», «пиццей».
+"""
+from __future__ import annotations
+import re
+from typing import Dict, List, Tuple
+
+# Окончания от длинных к коротким; от слова остаётся не меньше MIN_STEM букв
+_ENDINGS = sorted("""
+    иями ями ами ого его ему ому ыми ими ией ать ять ить еть ость ешь ишь ете ите
+    ая яя ое ее ие ые ой ей ий ый ом ем ам ям ах ях ую юю ов ев ию ья ье ьи ью ым им ых их
+    а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+MIN_STEM = 3
+
+# Маркеры подсветки в snippet(): заменяются на <b></b> после экранирования HTML
+HL_START, HL_END = "\x02", "\x03"
+
+def stem(word: str) -> str:
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+def fts_query(text: str) -> str:
+    """Запрос пользователя -> выражение MATCH: все слова, каждое как префикс."""
+    words = re.findall(r"\w+", text.lower().replace("ё", "е"))
+    return " ".join(f'"{stem(w)}"*' for w in words)
+
+def original_snippet(snippet: str, comment: str) -> str:
+    """snippet() режет текст индекса (ё → е); возвращает тот же фрагмент из
+    исходного комментария. Замена не меняет длину, так что позиции совпадают."""
+    if not snippet or not comment:
+        return snippet
+    plain = snippet.replace(HL_START, "").replace(HL_END, "")
+    core = plain.strip("…")
+    start = comment.replace("ё", "е").replace("Ё", "Е").find(core)
+    if not core or start < 0:
+        return snippet
+    lead = len(plain) - len(plain.lstrip("…"))
+    out, k = [], 0
+    for ch in snippet:
+        if ch in (HL_START, HL_END):
+            out.append(ch)
+            continue
+        out.append(comment[start + k - lead] if lead <= k < lead + len(core) else ch)
+        k += 1
+    return "".join(out)
+
+def search_feedback(conn, text: str, since_ts: int, limit: int, offset: int) -> Tuple[int, List[Dict]]:
+    """(всего совпадений, страница) — страница отсортирована по релевантности (bm25).
+
+    Период переводится в диапазон rowid: id отзывов растут вместе с created_at,
+    так что фильтр выполняет сам FTS5, без соединения с feedback на каждом совпадении.
+    """
+    match = fts_query(text)
+    if not match:
+        return 0, []
+    # без периода — все отзывы, включая перенесённые из v1 без даты (created_at NULL)
+    min_id = conn.execute("SELECT min(id) FROM feedback WHERE created_at >= ?", (since_ts,)).fetchone()[0] if since_ts else 0
+    if min_id is None:
+        return 0, []
+    total = conn.execute(
+        "SELECT COUNT(*) FROM feedback_fts WHERE feedback_fts MATCH ? AND rowid >= ?",
+        (match, min_id)
+    ).fetchone()[0]
+    rows = conn.execute(
+        f"""SELECT f.id, f.visit_id, f.service, f.taste, f.speed, f.clean, f.created_at, f.comment, m.snippet
+            FROM (SELECT rowid, rank, snippet(feedback_fts, 0, '{HL_START}', '{HL_END}', '…', 16) AS snippet
+                  FROM feedback_fts WHERE feedback_fts MATCH ? AND rowid >= ?
+                  ORDER BY rank LIMIT ? OFFSET ?) m
+            JOIN feedback f ON f.id = m.rowid
+            ORDER BY m.rank""",
+        (match, min_id, limit, offset)
+    ).fetchall()
+    return total, [dict(r, snippet=original_snippet(r["snippet"], r["comment"])) for r in rows]